@@ -2,10 +2,22 @@ import streamlit as st
 import pandas as pd
 import google.generativeai as genai
 import re
-from PIL import Image
+import numpy as np
+import faiss
+from PIL import Image, UnidentifiedImageError
 import requests
-import speech_recognition as sr
+import sounddevice as sd
+from google.cloud import speech
+from google.api_core import exceptions as google_exceptions
+from google.auth import exceptions as auth_exceptions
 import os
+import json
+import datetime
+import hashlib
+import queue
+import threading
+import io
+from concurrent.futures import ThreadPoolExecutor
 
 # Page configuration
 st.set_page_config(
@@ -26,36 +38,328 @@ st.markdown(
 
 st.caption("Multi-model chat application")
 
+# Attachments at least this long are sent once through Gemini context caching
+# instead of being resent with every turn. Caching requires a pinned model version.
+CONTEXT_CACHE_MODEL = 'models/gemini-1.5-flash-001'
+CONTEXT_CACHE_MIN_TOKENS = 32768
+CONTEXT_CACHE_TTL = datetime.timedelta(minutes=30)
+
+# Attachments that are not cached are cut down to this many tokens, keeping head and tail.
+# In the chat they also have to fit next to the history within the gemini-pro input limit.
+ATTACHMENT_TOKEN_BUDGET = 24000
+CHAT_INPUT_TOKEN_LIMIT = 30720
+PROMPT_TOKEN_RESERVE = 2048
+
+# Text-only prompts whose embedding is this close to an answered one reuse its response
+EMBEDDING_MODEL = 'models/embedding-001'
+SEMANTIC_CACHE_DIR = '.semantic_cache'
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# Microphone audio is streamed to Google Cloud Speech in 200 ms chunks of 16-bit mono
+SPEECH_SAMPLE_RATE = 16000
+SPEECH_BLOCK_SIZE = 3200
+
+# The vision model gains nothing from images larger than this
+IMAGE_MAX_SIZE = (1024, 1024)
+IMAGE_MAX_BYTES = 20 * 1024 * 1024
+
+# Fenced code block holding a graph or digraph definition, optionally strict and
+# preceded by comment lines
+GRAPHVIZ_RE = re.compile(
+    r"```(?:\w+)?\s*("
+    r"(?:(?://|#)[^\n`]*\n\s*|/\*(?:(?!\*/)[^`])*\*/\s*)*"
+    r"(?:strict\s+)?(?:di)?graph\b[^`]*?\{[^`]*?\})\s*```",
+    re.DOTALL,
+)
+
 #------------------------------------------------------------
 # FUNCTIONS
 def extract_graphviz_info(text: str) -> list:
     """Extracts graphviz code blocks from the given text."""
-    graphviz_info = text.split('```')
-    return [graph for graph in graphviz_info if ('graph' in graph or 'digraph' in graph) and ('{' in graph and '}' in graph)]
+    return GRAPHVIZ_RE.findall(text)
+
+def render_graphs(graphs: list) -> None:
+    """Renders the given graphviz code blocks."""
+    for graph in graphs:
+        st.graphviz_chart(graph, use_container_width=False)
+        with st.expander("View text"):
+            st.code(graph, language='dot')
 
 def append_message(message: dict) -> None:
     """Appends a message to the chat session."""
+    # Extract graphs once here so replaying the history does not parse them again
+    if message['role'] == 'model':
+        message['graphs'] = extract_graphviz_info(message['parts'])
     st.session_state.chat_session.append({'user': message})
 
+@st.cache_data(show_spinner=False)
+def read_text(file_bytes: bytes) -> str:
+    """Decodes an uploaded text file."""
+    return file_bytes.decode("utf-8", errors="replace")
+
+@st.cache_data(show_spinner=False)
+def read_table(file_bytes: bytes, name: str) -> pd.DataFrame:
+    """Reads an uploaded CSV or Excel file into a dataframe."""
+    if name.endswith('.csv'):
+        return pd.read_csv(io.BytesIO(file_bytes))
+    return pd.read_excel(io.BytesIO(file_bytes))
+
+@st.cache_data(show_spinner=False)
+def count_tokens(text: str, model_name: str) -> int:
+    """Counts the tokens of the text with the given model's tokenizer, once per distinct text."""
+    return genai.GenerativeModel(model_name).count_tokens(text).total_tokens
+
+def history_tokens(chat: genai.ChatSession) -> int:
+    """Counts the tokens already held in the chat history."""
+    if not chat.history:
+        return 0
+    try:
+        return chat.model.count_tokens(chat.history).total_tokens
+    except Exception:
+        # Roughly four characters per token
+        return sum(len(part.text) for content in chat.history for part in content.parts) // 4
+
+def truncate_tokens(text: str, budget: int, model_name: str) -> str:
+    """Shortens the text to about the token budget, keeping its head and tail."""
+    try:
+        n = count_tokens(text, model_name)
+    except Exception:
+        # Roughly four characters per token
+        n = len(text) // 4
+    if n <= budget:
+        return text
+    keep = len(text) * budget // n
+    head = text[:keep * 2 // 3]
+    tail = text[len(text) - keep // 3:]
+    return head + '\n...[truncated]...\n' + tail
+
+def get_context_cache(key: str, text: str):
+    """Returns a context cache holding the attached text, or None if it is too short to cache."""
+    release_context_caches(keep=key)
+
+    caches = st.session_state.caches
+    if key in caches:
+        cache = caches[key]
+        if cache is None:
+            return None
+        try:
+            cache.update(ttl=CONTEXT_CACHE_TTL)
+            return cache
+        except Exception:
+            # The cache expired on the server side, create it again below
+            del caches[key]
+
+    try:
+        if count_tokens(text, CONTEXT_CACHE_MODEL) < CONTEXT_CACHE_MIN_TOKENS:
+            caches[key] = None
+        else:
+            caches[key] = genai.caching.CachedContent.create(
+                model=CONTEXT_CACHE_MODEL,
+                display_name=key[:32],
+                contents=[{'role': 'user', 'parts': [text]}],
+                ttl=CONTEXT_CACHE_TTL,
+            )
+    except Exception as e:
+        st.warning(f"Could not cache the attachment, sending it with the message instead: {e}")
+        return None
+    return caches[key]
+
+def release_context_caches(keep: str = None) -> None:
+    """Deletes the context caches of attachments that are no longer in use."""
+    caches = st.session_state.caches
+    for key in [key for key in caches if key != keep]:
+        cache = caches.pop(key)
+        if cache is not None:
+            try:
+                cache.delete()
+            except Exception:
+                pass
+
+def bind_chat(cache, default: genai.GenerativeModel) -> None:
+    """Moves the chat to the model backed by the given context cache, keeping its history."""
+    name = cache.name if cache is not None else None
+    if st.session_state.chat_cache != name:
+        chat_model = default if cache is None else genai.GenerativeModel.from_cached_content(cache)
+        st.session_state.chat = chat_model.start_chat(history=st.session_state.chat.history)
+        st.session_state.chat_cache = name
+
+@st.cache_resource
+def load_semantic_cache() -> dict:
+    """Loads the semantic prompt cache saved on disk, shared by all sessions of the process."""
+    index_path = os.path.join(SEMANTIC_CACHE_DIR, 'index.faiss')
+    values_path = os.path.join(SEMANTIC_CACHE_DIR, 'values.json')
+    semantic_cache = {'index': None, 'values': [], 'lock': threading.Lock()}
+    if os.path.exists(index_path) and os.path.exists(values_path):
+        try:
+            index = faiss.read_index(index_path)
+            with open(values_path, encoding='utf-8') as f:
+                values = json.load(f)
+        except Exception:
+            return semantic_cache
+        if index.ntotal == len(values):
+            semantic_cache['index'] = index
+            semantic_cache['values'] = values
+    return semantic_cache
+
+def lookup_semantic_cache(text: str, semantic_cache: dict) -> tuple:
+    """Embeds the prompt and returns it along with the cached response of the closest prompt, if any."""
+    try:
+        embedding = genai.embed_content(model=EMBEDDING_MODEL, content=text, task_type='semantic_similarity')
+    except Exception:
+        return None, None
+    vector = np.array([embedding['embedding']], dtype='float32')
+    faiss.normalize_L2(vector)
+
+    with semantic_cache['lock']:
+        index = semantic_cache['index']
+        if index is None or index.ntotal == 0:
+            return vector, None
+        scores, ids = index.search(vector, 1)
+        if scores[0][0] > SEMANTIC_CACHE_THRESHOLD:
+            return vector, semantic_cache['values'][ids[0][0]]
+    return vector, None
+
+def store_semantic_cache(vector: np.ndarray, response: str, semantic_cache: dict) -> None:
+    """Adds a prompt embedding and its response to the semantic cache and saves it to disk."""
+    with semantic_cache['lock']:
+        if semantic_cache['index'] is None:
+            semantic_cache['index'] = faiss.IndexFlatIP(vector.shape[1])
+        semantic_cache['index'].add(vector)
+        semantic_cache['values'].append(response)
+
+        try:
+            os.makedirs(SEMANTIC_CACHE_DIR, exist_ok=True)
+            faiss.write_index(semantic_cache['index'], os.path.join(SEMANTIC_CACHE_DIR, 'index.faiss'))
+            with open(os.path.join(SEMANTIC_CACHE_DIR, 'values.json'), 'w', encoding='utf-8') as f:
+                json.dump(semantic_cache['values'], f)
+        except (OSError, RuntimeError):
+            # faiss reports write failures as RuntimeError, keep the in-memory cache
+            pass
+
+def compress_image(img: Image.Image) -> bytes:
+    """Downscales the image and encodes it as JPEG to keep it small in the session."""
+    img.thumbnail(IMAGE_MAX_SIZE, Image.LANCZOS)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=85)
+    return buf.getvalue()
+
+@st.cache_resource
+def get_speech_client(api_key: str = None) -> speech.SpeechClient:
+    """Creates the streaming speech client once per process, using default credentials without a key."""
+    if api_key is None:
+        return speech.SpeechClient()
+    return speech.SpeechClient(client_options={'api_key': api_key})
+
+@st.cache_data(show_spinner=False)
+def list_microphones() -> list:
+    """Lists the names of the input devices PortAudio found when it started."""
+    return [device['name'] for device in sd.query_devices() if device['max_input_channels'] > 0]
+
+def stream_transcript(client: speech.SpeechClient, placeholder) -> str:
+    """Streams microphone audio to the recognizer, showing interim results until the utterance ends."""
+    chunks = queue.Queue()
+
+    def on_audio(indata, frames, time, status) -> None:
+        chunks.put(bytes(indata))
+
+    def audio_requests():
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                return
+            yield speech.StreamingRecognizeRequest(audio_content=chunk)
+
+    config = speech.StreamingRecognitionConfig(
+        config=speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=SPEECH_SAMPLE_RATE,
+            language_code='en-US',
+        ),
+        interim_results=True,
+        single_utterance=True,
+    )
+
+    transcript = ''
+    try:
+        with sd.RawInputStream(samplerate=SPEECH_SAMPLE_RATE, blocksize=SPEECH_BLOCK_SIZE,
+                               dtype='int16', channels=1, callback=on_audio):
+            for response in client.streaming_recognize(config, audio_requests()):
+                for result in response.results:
+                    if not result.alternatives:
+                        continue
+                    transcript = result.alternatives[0].transcript
+                    placeholder.info(transcript)
+                    if result.is_final:
+                        return transcript
+    finally:
+        # Unblock the request generator so the stream can close
+        chunks.put(None)
+    return transcript
+
+def load_image_url(url: str) -> Image.Image:
+    """Downloads an image in chunks and releases the connection before decoding."""
+    too_large = ValueError(f"The image is larger than {IMAGE_MAX_BYTES // (1024 * 1024)} MB")
+    with requests.get(url, stream=True, timeout=10) as r:
+        r.raise_for_status()
+        if int(r.headers.get('Content-Length', 0)) > IMAGE_MAX_BYTES:
+            raise too_large
+        buf = io.BytesIO()
+        for chunk in r.iter_content(chunk_size=64 * 1024):
+            buf.write(chunk)
+            if buf.tell() > IMAGE_MAX_BYTES:
+                raise too_large
+    buf.seek(0)
+    img = Image.open(buf)
+    img.load()
+    return img
+
 @st.cache_resource
-def load_model() -> genai.GenerativeModel:
-    """Loads the generative model for text tasks."""
-    model = genai.GenerativeModel('gemini-pro')
-    return model
+def configure_genai(api_key: str) -> bool:
+    """Configures the Gemini client once per process and API key."""
+    genai.configure(api_key=api_key)
+    return True
 
 @st.cache_resource
-def load_modelvision() -> genai.GenerativeModel:
-    """Loads the generative model for vision tasks."""
-    model = genai.GenerativeModel('gemini-1.5-flash')
-    return model
+def get_executor() -> ThreadPoolExecutor:
+    """Returns the thread pool used for background model calls."""
+    return ThreadPoolExecutor(4)
+
+@st.fragment(run_every=0.5)
+def show_welcome() -> None:
+    """Shows the welcome message once its background request finishes."""
+    st.session_state.welcome_polls += 1
+    future = st.session_state.welcome_future
+    with st.chat_message('ai'):
+        if not future.done():
+            st.write("…")
+            return
+        try:
+            st.session_state.welcome = future.result().text
+        except Exception as e:
+            st.session_state.welcome = f'{type(e).__name__}: {e}'
+        st.write(st.session_state.welcome)
+
+    # Stop polling, but never rerun from inside a full script run
+    if st.session_state.welcome_polls > 1:
+        st.rerun()
+
+@st.cache_resource
+def load_models() -> tuple:
+    """Loads the generative models for text and vision tasks."""
+    return genai.GenerativeModel('gemini-pro'), genai.GenerativeModel('gemini-1.5-flash')
 
 #------------------------------------------------------------
 # CONFIGURATION
 api_key = st.secrets['GOOGLE_API_KEY']['api_key']
-genai.configure(api_key=api_key)
+# Gemini keys are usually restricted to the Generative Language API, so Cloud Speech
+# gets its own key or falls back to application default credentials
+speech_api_key = st.secrets.get('GOOGLE_SPEECH_API_KEY', {}).get('api_key')
+configure_genai(api_key)
 
-model = load_model()
-vision = load_modelvision()
+model, vision = load_models()
+semantic_cache = load_semantic_cache()
 
 if 'chat' not in st.session_state:
     st.session_state.chat = model.start_chat(history=[])
@@ -63,41 +367,45 @@ if 'chat' not in st.session_state:
 if 'chat_session' not in st.session_state:
     st.session_state.chat_session = []
 
+# Request the welcome message in the background so the page paints right away
+if 'welcome' not in st.session_state and 'welcome_future' not in st.session_state:
+    st.session_state.welcome_future = get_executor().submit(model.generate_content, '''
+    Welcome message to the user describing what the chatbot can do.
+    You can describe images, answer questions, read text files, read tables, generate Graphviz graphs, etc.
+    ''')
+
+if 'caches' not in st.session_state:
+    st.session_state.caches = {}
+    st.session_state.chat_cache = None
+    st.session_state.sent_attachment = None
+
 #------------------------------------------------------------
 # CHAT INTERFACE
 if 'messages' not in st.session_state:
     st.session_state.messages = []
 
 if 'welcome' not in st.session_state:
-    welcome = model.generate_content('''
-    Welcome message to the user describing what the chatbot can do.
-    You can describe images, answer questions, read text files, read tables, generate Graphviz graphs, etc.
-    ''')
-    welcome.resolve()
-    st.session_state.welcome = welcome
-    with st.chat_message('ai'):
-        st.write(st.session_state.welcome.text)
+    st.session_state.welcome_polls = 0
+    show_welcome()
 else:
     with st.chat_message('ai'):
-        st.write(st.session_state.welcome.text)
+        st.write(st.session_state.welcome)
 
 if len(st.session_state.chat_session) > 0:
     for message in st.session_state.chat_session:
         if message['user']['role'] == 'model':
             with st.chat_message('ai'):
                 st.write(message['user']['parts'])
-                graphs = extract_graphviz_info(message['user']['parts'])
-                if graphs:
-                    for graph in graphs:
-                        st.graphviz_chart(graph, use_container_width=False)
-                        with st.expander("View text"):
-                            st.code(graph, language='dot')
+                render_graphs(message['user'].get('graphs', ()))
         else:
             with st.chat_message('user'):
                 st.write(message['user']['parts'][0])
                 if len(message['user']['parts']) > 1:
                     st.image(message['user']['parts'][1], width=200)
 
+# The exchange for a new prompt renders here, under the history and above the attachments
+live = st.container()
+
 #------------------------------------------------------------
 # ATTACHMENT HANDLING
 cols = st.columns(4)
@@ -128,14 +436,11 @@ else:
     csvexcelattachment = None
 
 if audio_input:
-    # Initialize SpeechRecognition
-    r = sr.Recognizer()
-
-    # Function to check if the default microphone is available
+    # Function to check if an input device is available
     def check_microphone() -> bool:
         try:
-            # List all available microphones
-            mic_list = sr.Microphone.list_microphone_names()
+            # List all available input devices
+            mic_list = list_microphones()
             if not mic_list:
                 return False
             return True
@@ -149,15 +454,19 @@ if audio_input:
         prompt = None
     else:
         try:
-            with sr.Microphone() as source:
-                st.info("Speak now...")
-                audio = r.listen(source)
-            try:
-                prompt = r.recognize_google(audio)
-            except sr.UnknownValueError:
+            # Reuse the streaming speech client across reruns
+            speech_client = get_speech_client(speech_api_key)
+            placeholder = st.empty()
+            placeholder.info("Speak now...")
+            prompt = stream_transcript(speech_client, placeholder)
+            placeholder.empty()
+            if not prompt:
                 st.warning("Sorry, I couldn't understand what you said.")
                 prompt = None
-        except sr.RequestError:
+        except auth_exceptions.DefaultCredentialsError:
+            st.error("No credentials for Google Cloud Speech. Add a GOOGLE_SPEECH_API_KEY secret or set up application default credentials.")
+            prompt = None
+        except google_exceptions.GoogleAPICallError:
             st.error("Could not request results from Google Speech Recognition service.")
             prompt = None
         except Exception as e:
@@ -168,37 +477,131 @@ else:
 
 if prompt:
     txt = ''
+    attachment = b''
     if txtattachment:
-        txt = txtattachment.getvalue().decode("utf-8")
-        txt = '   Text file: \n' + txt
+        attachment += txtattachment.getvalue()
+        txt += '   Text file: \n' + read_text(txtattachment.getvalue())
 
-    if len(txt) > 5000:
-        txt = txt[:5000] + '...'
+    if csvexcelattachment:
+        try:
+            table = read_table(csvexcelattachment.getvalue(), csvexcelattachment.name)
+        except Exception as e:
+            st.error(f"Could not read the table: {e}")
+            st.stop()
+        attachment += csvexcelattachment.getvalue()
+        txt += '   Table file: \n' + table.to_csv(index=False)
 
-    if image or url:
-        if url:
-            img = Image.open(requests.get(url, stream=True).raw)
+    cache = None
+    attachment_key = hashlib.sha256(attachment).hexdigest()
+    if txt:
+        cache = get_context_cache(attachment_key, txt)
+    else:
+        release_context_caches()
+    bind_chat(cache, model)
+
+    sending_attachment = None
+    if cache is not None:
+        # The attachment already lives in the cached prefix
+        txt = ''
+    elif txt and (image or url):
+        # The vision model gets no history, so the attachment goes with every call
+        txt = truncate_tokens(txt, ATTACHMENT_TOKEN_BUDGET, vision.model_name)
+    elif txt and st.session_state.sent_attachment == attachment_key:
+        # The chat history already holds this attachment, send it only once
+        txt = ''
+    elif txt:
+        budget = min(ATTACHMENT_TOKEN_BUDGET,
+                     CHAT_INPUT_TOKEN_LIMIT - PROMPT_TOKEN_RESERVE - history_tokens(st.session_state.chat))
+        if budget > 0:
+            txt = truncate_tokens(txt, budget, model.model_name)
+            sending_attachment = attachment_key
         else:
-            img = Image.open(image)
-        prmt = {'role': 'user', 'parts': [prompt + txt, img]}
+            st.warning("The conversation is too long to add the attachment to it.")
+            txt = ''
+
+    vision_model = vision if cache is None else genai.GenerativeModel.from_cached_content(cache)
+
+    if image or url:
+        try:
+            if url:
+                img = load_image_url(url)
+            else:
+                img = Image.open(image)
+            image_bytes = compress_image(img)
+        except requests.RequestException as e:
+            st.error(f"Could not download the image: {e}")
+            st.stop()
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError) as e:
+            st.error(f"Could not read the image: {e}")
+            st.stop()
+        prmt = {'role': 'user', 'parts': [prompt, image_bytes]}
     else:
-        prmt = {'role': 'user', 'parts': [prompt + txt]}
+        prmt = {'role': 'user', 'parts': [prompt]}
+
+    # The session keeps and shows only what the user typed, the attachment goes to the model
+    model_prompt = prompt + txt
 
     append_message(prmt)
 
-    with st.spinner("Wait a moment, I am thinking..."):
-        if len(prmt['parts']) > 1:
-            response = vision.generate_content(prmt['parts'], stream=True, safety_settings=[
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_LOW_AND_ABOVE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_LOW_AND_ABOVE"},
-            ])
-            response.resolve()
-        else:
-            response = st.session_state.chat.send_message(prmt['parts'][0])
+    with live:
+        with st.chat_message('user'):
+            st.write(prmt['parts'][0])
+            if len(prmt['parts']) > 1:
+                st.image(prmt['parts'][1], width=200)
 
-        try:
-            append_message({'role': 'model', 'parts': response.text})
-        except Exception as e:
-            append_message({'role': 'model', 'parts': f'{type(e).__name__}: {e}'})
+        with st.chat_message('ai'):
+            placeholder = st.empty()
+            full = ''
 
-        st.rerun()
+            # Only the opening prompt of a conversation, without attachments, goes through
+            # the semantic cache. Later prompts depend on the conversation, and an attached
+            # file would dominate the embedding and leak into the shared cache.
+            vector, cached = None, None
+            first_turn = len(st.session_state.chat_session) == 1
+            if first_turn and len(prmt['parts']) == 1 and not txtattachment and not csvexcelattachment:
+                vector, cached = lookup_semantic_cache(model_prompt, semantic_cache)
+
+            if cached is not None:
+                full = cached
+                placeholder.markdown(full)
+                st.session_state.chat.history = st.session_state.chat.history + [
+                    {'role': 'user', 'parts': [model_prompt]},
+                    {'role': 'model', 'parts': [full]},
+                ]
+            else:
+                try:
+                    with st.spinner("Wait a moment, I am thinking..."):
+                        if len(prmt['parts']) > 1:
+                            image_part = {'mime_type': 'image/jpeg', 'data': prmt['parts'][1]}
+                            response = vision_model.generate_content([model_prompt, image_part], stream=True, safety_settings=[
+                                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_LOW_AND_ABOVE"},
+                                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_LOW_AND_ABOVE"},
+                            ])
+                        else:
+                            response = st.session_state.chat.send_message(model_prompt, stream=True)
+
+                    # Render chunks as they arrive instead of waiting for the full response
+                    for chunk in response:
+                        full += chunk.text
+                        placeholder.markdown(full)
+                    if len(prmt['parts']) == 1:
+                        # Surfaces a stream that stopped early, which would otherwise
+                        # break every later read of the chat history
+                        st.session_state.chat.history
+                        if sending_attachment is not None:
+                            st.session_state.sent_attachment = sending_attachment
+                except Exception as e:
+                    # Drop the failed turn so the chat stays usable, but keep what was streamed
+                    if len(prmt['parts']) == 1 and st.session_state.chat.last is not None:
+                        st.session_state.chat.rewind()
+                    error = f'{type(e).__name__}: {e}'
+                    full = full + '\n\n' + error if full else error
+                    placeholder.markdown(full)
+                    vector = None
+
+                if vector is not None:
+                    store_semantic_cache(vector, full, semantic_cache)
+
+            message = {'role': 'model', 'parts': full}
+            append_message(message)
+            render_graphs(message['graphs'])
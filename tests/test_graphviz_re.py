@@ -0,0 +1,45 @@
+import ast
+import pathlib
+import re
+import time
+import unittest
+
+CHAT = pathlib.Path(__file__).resolve().parent.parent / 'chat.py'
+
+
+def load_graphviz_re() -> re.Pattern:
+    """Evaluates the GRAPHVIZ_RE assignment from chat.py without running the app."""
+    tree = ast.parse(CHAT.read_text(encoding='utf-8'))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(getattr(t, 'id', None) == 'GRAPHVIZ_RE' for t in node.targets):
+            return eval(compile(ast.Expression(node.value), str(CHAT), 'eval'), {'re': re})
+    raise LookupError('GRAPHVIZ_RE not found in chat.py')
+
+
+GRAPHVIZ_RE = load_graphviz_re()
+
+
+class GraphvizReTest(unittest.TestCase):
+    def test_finds_graphs(self):
+        text = (
+            "```dot\ndigraph G {\n a -> b;\n}\n```\n"
+            "```\nstrict digraph { a -> b }\n```\n"
+            "```dot\n// title\n/* note */\ngraph { a -- b }\n```\n"
+            "```python\nx = {1}\n```"
+        )
+        self.assertEqual(GRAPHVIZ_RE.findall(text), [
+            "digraph G {\n a -> b;\n}",
+            "strict digraph { a -> b }",
+            "// title\n/* note */\ngraph { a -- b }",
+        ])
+
+    def test_long_comment_run_is_linear(self):
+        # Block comments that could merge into each other used to backtrack exponentially
+        text = "```c\n" + "/* line */\n" * 40 + "int main() { return 0; }\n```"
+        start = time.perf_counter()
+        self.assertEqual(GRAPHVIZ_RE.findall(text), [])
+        self.assertLess(time.perf_counter() - start, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()